@@ -2,9 +2,9 @@
 """Dilma Streamlit Dashboard — Model Comparison Page"""
 from __future__ import annotations
 
-import json
+import os
 import pathlib
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import streamlit as st
@@ -24,32 +24,40 @@ st.title("Dilma — Model vs. Model Comparison")
 # -----------------------------------------------------------------------------
 
 
-def read_jsonl(fp: pathlib.Path):
-    for line in fp.read_text(encoding="utf-8").splitlines():
-        if line.strip():
-            yield json.loads(line)
+DILEMMA_COLS = [
+    "id",
+    "order",
+    "tractate",
+    "title",
+    "vignette",
+    "option_A_tags",
+    "option_B_tags",
+    "option_A_text",
+    "option_B_text",
+]
+
+
+def dilemma_frame(jf: pathlib.Path) -> pd.DataFrame:
+    df = pd.read_json(jf, lines=True, dtype=False, convert_dates=False)
+    opt_a = df["options"].str[0]
+    opt_b = df["options"].str[1]
+    return df.assign(
+        order=jf.parent.name,
+        tractate=jf.stem,
+        option_A_tags=opt_a.str["tags"].str.join("|"),
+        option_B_tags=opt_b.str["tags"].str.join("|"),
+        option_A_text=opt_a.str["text"],
+        option_B_text=opt_b.str["text"],
+    )[DILEMMA_COLS]
 
 
 def load_dilemmas() -> pd.DataFrame:
-    rows: List[Dict] = []
-    for jf in DILEMMA_DIR.rglob("*.jsonl"):
-        order_name = jf.parent.name
-        tract = jf.stem
-        for obj in read_jsonl(jf):
-            rows.append(
-                {
-                    "id": obj["id"],
-                    "order": order_name,
-                    "tractate": tract,
-                    "title": obj["title"],
-                    "vignette": obj["vignette"],
-                    "option_A_tags": "|".join(obj["options"][0]["tags"]),
-                    "option_B_tags": "|".join(obj["options"][1]["tags"]),
-                    "option_A_text": obj["options"][0]["text"],
-                    "option_B_text": obj["options"][1]["text"],
-                }
-            )
-    return pd.DataFrame(rows)
+    # Files are independent; overlap their reads (results keep rglob order)
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+        frames = list(ex.map(dilemma_frame, DILEMMA_DIR.rglob("*.jsonl")))
+    if not frames:
+        return pd.DataFrame(columns=DILEMMA_COLS)
+    return pd.concat(frames, ignore_index=True)
 
 
 def load_run() -> pd.DataFrame:
@@ -17,11 +17,13 @@ Data sources
 """
 from __future__ import annotations
 
-import json
+import hashlib
+import os
 import pathlib
-from collections import Counter
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 import matplotlib.pyplot as plt
@@ -29,6 +31,11 @@ import matplotlib.pyplot as plt
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 DILEMMA_DIR = ROOT / "data" / "dilemmas"
 RUN_CSV = ROOT / "results" / "value_label_distribution.csv"
+CACHE_DIR = ROOT / "data" / ".cache"
+
+# Copy-on-write is always on from pandas 3.0; opt in explicitly before that.
+if int(pd.__version__.split(".", 1)[0]) < 3:
+    pd.options.mode.copy_on_write = True
 
 st.set_page_config(page_title="Dilma Dashboard", layout="wide")
 st.title("Dilma — Model Behaviour Dashboard")
@@ -38,71 +45,190 @@ st.title("Dilma — Model Behaviour Dashboard")
 # -----------------------------------------------------------------------------
 
 
-def read_jsonl(fp: pathlib.Path):
-    for line in fp.read_text(encoding="utf-8").splitlines():
-        if line.strip():
-            yield json.loads(line)
-
-
-def load_dilemmas() -> pd.DataFrame:
-    rows: List[Dict] = []
-    for jf in DILEMMA_DIR.rglob("*.jsonl"):
-        order_name = jf.parent.name  # e.g., 'nezikin'
-        tract = jf.stem  # e.g., 'bava_metzia'
-        for obj in read_jsonl(jf):
-            rows.append(
-                {
-                    "id": obj["id"],
-                    "order": order_name,
-                    "tractate": tract,
-                    "title": obj["title"],
-                    "vignette": obj["vignette"],
-                    "option_A_tags": "|".join(obj["options"][0]["tags"]),
-                    "option_B_tags": "|".join(obj["options"][1]["tags"]),
-                    "option_A_text": obj["options"][0]["text"],
-                    "option_B_text": obj["options"][1]["text"],
-                }
-            )
-    return pd.DataFrame(rows)
-
-
-def load_run() -> pd.DataFrame:
-    if not RUN_CSV.exists():
+DILEMMA_COLS = [
+    "id",
+    "order",
+    "tractate",
+    "title",
+    "vignette",
+    "option_A_tags",
+    "option_B_tags",
+    "option_A_text",
+    "option_B_text",
+]
+# Low-cardinality dilemma columns kept as pandas categories
+CATEGORY_COLS = ["order", "tractate", "option_A_tags", "option_B_tags"]
+
+
+def dilemma_frame(jf: pathlib.Path) -> pd.DataFrame:
+    # Parse the whole file in pandas' C reader rather than line by line
+    df = pd.read_json(jf, lines=True, dtype=False, convert_dates=False)
+    opt_a = df["options"].str[0]
+    opt_b = df["options"].str[1]
+    return df.assign(
+        order=jf.parent.name,  # e.g., 'nezikin'
+        tractate=jf.stem,  # e.g., 'bava_metzia'
+        option_A_tags=opt_a.str["tags"].str.join("|"),
+        option_B_tags=opt_b.str["tags"].str.join("|"),
+        option_A_text=opt_a.str["text"],
+        option_B_text=opt_b.str["text"],
+    )[DILEMMA_COLS]
+
+
+@st.cache_data(show_spinner=False)
+def dilemma_file_frame(path: str, mtime_ns: int, size: int) -> pd.DataFrame:
+    """One file's frame, memoised on its stat so only edited files re-parse."""
+    return dilemma_frame(pathlib.Path(path))
+
+
+def dilemma_files_key() -> tuple:
+    """Cache key for the dilemma tree: (path, mtime, size) per JSONL, walk order."""
+    key = []
+    for p in DILEMMA_DIR.rglob("*.jsonl"):
+        stat = p.stat()
+        key.append((str(p), stat.st_mtime_ns, stat.st_size))
+    return tuple(key)
+
+
+def run_csv_key() -> int | None:
+    """Cache key for the run CSV: its mtime, or None when it does not exist."""
+    return RUN_CSV.stat().st_mtime_ns if RUN_CSV.exists() else None
+
+
+def parse_dilemmas(files_key: tuple) -> pd.DataFrame:
+    # Files are independent; overlap their reads (results keep walk order)
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+        frames = list(ex.map(lambda k: dilemma_file_frame(*k), files_key))
+    if not frames:
+        return pd.DataFrame(columns=DILEMMA_COLS)
+    # Few distinct values per column: store them as integer-coded categories
+    return pd.concat(frames, ignore_index=True).astype(
+        {c: "category" for c in CATEGORY_COLS}
+    )
+
+
+@st.cache_data(show_spinner=False)
+def load_dilemmas(files_key: tuple) -> pd.DataFrame:
+    """Parsed dilemmas, persisted as Parquet so restarts skip the JSON parse.
+
+    The cache file is named after a digest of ``files_key`` and the column
+    layout; any edit to the JSONL tree (or to the layout) produces a new name,
+    and stale snapshots are removed.
+    """
+    layout = (DILEMMA_COLS, CATEGORY_COLS)
+    digest = hashlib.sha1(repr((layout, files_key)).encode()).hexdigest()[:16]
+    cache_path = CACHE_DIR / f"dilemmas-{digest}.parquet"
+    df = None
+    if cache_path.exists():
+        try:
+            df = pd.read_parquet(cache_path, columns=DILEMMA_COLS)
+        except (ImportError, OSError, ValueError):
+            # No Parquet engine or an unreadable snapshot (pyarrow's errors
+            # derive from OSError/ValueError); rebuild it from the JSONL files
+            pass
+
+    if df is None:
+        df = parse_dilemmas(files_key)
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(cache_path, compression="zstd", index=False)
+            for old in CACHE_DIR.glob("dilemmas-*.parquet"):
+                if old != cache_path:
+                    old.unlink(missing_ok=True)
+        except (ImportError, OSError):
+            pass  # No Parquet engine or read-only tree; the JSONL path still works
+    # Index by id (keeping the column) so runs can be matched by index lookup
+    return df.set_index("id", drop=False)
+
+
+@st.cache_data(show_spinner=False)
+def load_run(csv_key: int | None) -> pd.DataFrame:
+    if csv_key is None:
         return pd.DataFrame()
-    df = pd.read_csv(RUN_CSV)
+    df = pd.read_csv(
+        RUN_CSV,
+        dtype={
+            "dilemma_id": "category",
+            "choice_id": "category",
+            "model_name": "category",
+            "dilemma_type": "category",
+        },
+    )
 
     # Normalize delimiters; support both "|" and "," just in case
-    def _split(s: str):
-        if not s:
-            return []
-        return [
-            x.strip() for part in s.split("|") for x in part.split(",") if x.strip()
-        ]
-
-    df["chosen_value_labels"] = df["chosen_value_labels"].fillna("").apply(_split)
+    labels = df["chosen_value_labels"].fillna("").str.replace(",", "|", regex=False)
+    df["chosen_value_labels"] = [
+        [t for t in (x.strip() for x in v.split("|")) if t] for v in labels.to_numpy()
+    ]
     return df
 
 
+@st.cache_data(show_spinner=False)
+def filter_df(
+    files_key: tuple, csv_key: int | None, sel_tractate: str, sel_dilemma_type: str
+) -> tuple[pd.DataFrame, pd.DataFrame, bool]:
+    """Tractate- and type-filtered (dilemmas, runs), memoised per selection.
+
+    The flag is True when a type filter was requested but the run data has
+    no `dilemma_type` column to apply it to.
+    """
+    dl_df = load_dilemmas(files_key)
+    run_df = load_run(csv_key)
+
+    if sel_tractate != "All":
+        dl_df = dl_df[dl_df["tractate"] == sel_tractate]
+        if not run_df.empty:
+            run_df = run_df[run_df["dilemma_id"].isin(dl_df.index)]
+
+    missing_type_col = False
+    if sel_dilemma_type != "All":
+        if "dilemma_type" in run_df.columns:
+            run_df = run_df[run_df["dilemma_type"] == sel_dilemma_type.lower()]
+        else:
+            # Only warn if there was data to filter
+            missing_type_col = not run_df.empty
+    return dl_df, run_df, missing_type_col
+
+
+def get_fig_slot():
+    """This session's Figure/Axes for the bipolar chart; callers reset it with
+    ``ax.cla()``. Kept per session so concurrent reruns never share an Axes."""
+    if "fig_slot" not in st.session_state:
+        st.session_state.fig_slot = plt.subplots(figsize=(5, 3))
+    return st.session_state.fig_slot
+
+
 # -----------------------------------------------------------------------------
 # Global Definitions & Initial Data Load
 # -----------------------------------------------------------------------------
 
 # Define the poles for each axis (used by Chart 2 on this page)
-axes = {
-    "Survival / Welfare": ("self-preservation", "altruism"),
-    "Entitlement / Obligation": ("property-rights", "responsibility"),
-    "Even-split / Protection": ("reciprocity", "worker-dignity"),
-    "Sacred Life / Instrumental Life": ("sanctity-of-life", "utilitarian"),
-    "Legal Authority / Personal Agency": ("rule-of-law", "vigilantism"),
-    "Transcendent Norm / Pragmatism": ("religious-duty", "proportionality"),
-}
-
-dl_df_full = load_dilemmas()  # Load all dilemmas, keep a full copy
-run_df_original = load_run()  # Keep original for full model lists
-
-# Make copies for filtering on this page
-dl_df = dl_df_full.copy()
-run_df = run_df_original.copy()
+AXES = MappingProxyType(
+    {
+        "Survival / Welfare": ("self-preservation", "altruism"),
+        "Entitlement / Obligation": ("property-rights", "responsibility"),
+        "Even-split / Protection": ("reciprocity", "worker-dignity"),
+        "Sacred Life / Instrumental Life": ("sanctity-of-life", "utilitarian"),
+        "Legal Authority / Personal Agency": ("rule-of-law", "vigilantism"),
+        "Transcendent Norm / Pragmatism": ("religious-duty", "proportionality"),
+    }
+)
+# Reverse index: pole tag -> (axis, side)
+TAG_TO_AXIS = MappingProxyType(
+    {
+        tag: (axis, side)
+        for axis, poles in AXES.items()
+        for side, tag in zip(("left", "right"), poles)
+    }
+)
+
+files_key = dilemma_files_key()
+csv_key = run_csv_key()
+dl_df_full = load_dilemmas(files_key)  # Load all dilemmas, never mutated below
+run_df_original = load_run(csv_key)  # Keep original for full model lists
+
+# Filters below only derive new frames from these; with copy-on-write the
+# masked selections share buffers with the originals instead of duplicating them.
 
 # -----------------------------------------------------------------------------
 # Global top-bar filters (Tractate & Model)
@@ -135,21 +261,6 @@ with col1:
 # Persist tractate selection
 st.session_state.sel_tractate = sel_tractate
 
-# Apply tractate filter first, as it affects options for other filters
-dl_df_filtered_by_tractate = dl_df_full.copy()
-run_df_filtered_by_tractate = run_df_original.copy()
-
-if sel_tractate != "All":
-    dl_df_filtered_by_tractate = dl_df_filtered_by_tractate[
-        dl_df_filtered_by_tractate["tractate"] == sel_tractate
-    ]
-    if not run_df_filtered_by_tractate.empty:
-        run_df_filtered_by_tractate = run_df_filtered_by_tractate[
-            run_df_filtered_by_tractate["dilemma_id"].isin(
-                dl_df_filtered_by_tractate["id"]
-            )
-        ]
-
 
 # --- Dilemma Type Filter ---
 with col2:
@@ -169,18 +280,16 @@ with col2:
 # Persist dilemma type selection
 st.session_state.sel_dilemma_type = sel_dilemma_type
 
-# Apply dilemma_type filter to a copy of tractate-filtered run_df
-run_df_filtered_by_type = run_df_filtered_by_tractate.copy()
-if sel_dilemma_type != "All":
-    if "dilemma_type" in run_df_filtered_by_type.columns:
-        run_df_filtered_by_type = run_df_filtered_by_type[
-            run_df_filtered_by_type["dilemma_type"] == sel_dilemma_type.lower()
-        ]
-    else:
-        if not run_df_filtered_by_type.empty:  # Only warn if there was data to filter
-            st.warning(
-                "`dilemma_type` column not found in run data. Cannot filter by dilemma type. Please ensure your CSV includes this column."
-            )
+# Apply tractate filter, then dilemma_type filter (memoised per selection)
+(
+    dl_df_filtered_by_tractate,
+    run_df_filtered_by_type,
+    missing_type_col,
+) = filter_df(files_key, csv_key, sel_tractate, sel_dilemma_type)
+if missing_type_col:
+    st.warning(
+        "`dilemma_type` column not found in run data. Cannot filter by dilemma type. Please ensure your CSV includes this column."
+    )
 
 
 # --- Compute model list based on selected tractate AND dilemma_type ---
@@ -211,10 +320,10 @@ st.session_state.sel_model = sel_model
 
 # Apply filters to dl_df and run_df for this page
 # dl_df is primarily filtered by tractate for display purposes
-dl_df = dl_df_filtered_by_tractate.copy()
+dl_df = dl_df_filtered_by_tractate
 
 # run_df starts from the tractate and type filtered data, then applies model filter
-run_df = run_df_filtered_by_type.copy()
+run_df = run_df_filtered_by_type
 if sel_model != "All" and not run_df.empty and "model_name" in run_df.columns:
     run_df = run_df[run_df["model_name"] == sel_model]
 
@@ -223,14 +332,12 @@ if sel_model != "All" and not run_df.empty and "model_name" in run_df.columns:
 # -----------------------------------------------------------------------------
 st.subheader("Value‑label distribution of model choices")
 
-# tag_counter uses the page-specific filtered run_df
-tag_counter = Counter(t for lst in run_df["chosen_value_labels"] for t in lst)
-if tag_counter:
-    tag_df = (
-        pd.DataFrame(tag_counter.items(), columns=["label", "count"])
-        .sort_values("count", ascending=False)
-        .set_index("label")
-    )
+# One (row, tag) series for the page-specific filtered run_df, shared by both
+# charts so the label lists are only flattened once per rerun
+tag_series = run_df["chosen_value_labels"].explode().dropna()
+tag_counts = tag_series.value_counts()
+if not tag_counts.empty:
+    tag_df = tag_counts.rename_axis("label").to_frame("count")
     st.bar_chart(tag_df)
 else:
     st.info(
@@ -242,57 +349,65 @@ else:
 # -----------------------------------------------------------------------------
 st.subheader("Bipolar axes: self ←  → other")
 
-# This chart also uses the page-specific filtered run_df
-rows = []
-for axis, (left_tag, right_tag) in axes.items():
-    left_cnt = run_df["chosen_value_labels"].apply(lambda x: left_tag in x).sum()
-    right_cnt = run_df["chosen_value_labels"].apply(lambda x: right_tag in x).sum()
-    invalid_cnt = (
-        run_df["chosen_value_labels"]
-        .apply(lambda x: "invalid" in x and left_tag not in x and right_tag not in x)
-        .sum()
-    )
-    rows.append(
-        {
-            "axis": axis,
-            "left": -left_cnt,
-            "right": right_cnt,
-            "invalid": invalid_cnt,
-        }
-    )
-
-ax_df = pd.DataFrame(rows).set_index("axis")
+# This chart reuses tag_series from Chart 1.
+# One (row, tag) pair per distinct label, mapped onto the axis poles in one pass.
+pairs = tag_series.rename("tag").rename_axis("row").reset_index().drop_duplicates()
+hits = pairs["tag"].map(TAG_TO_AXIS).dropna()
+axis_side = pd.DataFrame(
+    hits.tolist(), index=hits.index, columns=["axis", "side"]
+).assign(row=pairs["row"])
+pole_counts = (
+    axis_side.groupby(["axis", "side"])
+    .size()
+    .unstack(fill_value=0)
+    .reindex(index=list(AXES), columns=["left", "right"], fill_value=0)
+)
+# "invalid" answers count against every axis whose poles they did not also pick
+invalid_rows = pairs.loc[pairs["tag"] == "invalid", "row"]
+invalid_touching_axis = (
+    axis_side[axis_side["row"].isin(invalid_rows)]
+    .drop_duplicates(["axis", "row"])
+    .groupby("axis")
+    .size()
+    .reindex(list(AXES), fill_value=0)
+)
+ax_df = pd.DataFrame(
+    {
+        "left": -pole_counts["left"],
+        "right": pole_counts["right"],
+        "invalid": len(invalid_rows) - invalid_touching_axis,
+    }
+).rename_axis("axis")
 
 if not ax_df[["left", "right", "invalid"]].abs().values.sum():
     st.info("No run data yet for bipolar axes chart for the current selection.")
 else:
-    fig, ax = plt.subplots(figsize=(5, 3))
-    left_bars = ax.barh(
-        ax_df.index, ax_df["left"], color="#dd8452", label="Self-leaning"
-    )
-    right_bars = ax.barh(
-        ax_df.index, ax_df["right"], color="#4c72b0", label="Other-leaning"
-    )
+    left_np = ax_df["left"].to_numpy()
+    right_np = ax_df["right"].to_numpy()
+    invalid_np = ax_df["invalid"].to_numpy()
+    fig, ax = get_fig_slot()
+    ax.cla()
+    left_bars = ax.barh(ax_df.index, left_np, color="#dd8452", label="Self-leaning")
+    right_bars = ax.barh(ax_df.index, right_np, color="#4c72b0", label="Other-leaning")
     invalid_bars = ax.barh(
         ax_df.index,
-        ax_df["invalid"],
-        left=ax_df["right"].clip(lower=0),
+        invalid_np,
+        left=np.maximum(right_np, 0),
         color="#999999",
         label="Invalid",
     )
-    for bars_collection in (left_bars, right_bars, invalid_bars):
-        for bar in bars_collection:
-            w = bar.get_width()
-            if w != 0:
-                ax.text(
-                    bar.get_x() + w / 2,
-                    bar.get_y() + bar.get_height() / 2,
-                    f"{abs(int(w))}",
-                    ha="center",
-                    va="center",
-                    fontsize=8,
-                    color="white",
-                )
+    for bars, vals in (
+        (left_bars, left_np),
+        (right_bars, right_np),
+        (invalid_bars, invalid_np),
+    ):
+        ax.bar_label(
+            bars,
+            labels=[f"{abs(int(v))}" if v else "" for v in vals],
+            label_type="center",
+            fontsize=8,
+            color="white",
+        )
     ax.axvline(0, color="black", linewidth=0.6)
     ax.set_xlabel("Count of answers")
     ax.legend(loc="upper right")
@@ -304,4 +419,19 @@ else:
 st.subheader("Dilemmas")
 # This table uses the page-specific filtered dl_df
 show_cols = ["id", "title", "vignette", "option_A_text", "option_B_text"]
-st.dataframe(dl_df[show_cols], use_container_width=True)
+# Only ship the requested slice to the frontend on each rerun
+n_rows = st.slider("Rows to show", 50, 2000, 200, step=50, key="dilemma_table_rows")
+st.caption(f"Showing {min(n_rows, len(dl_df))} of {len(dl_df)} dilemmas")
+st.dataframe(
+    dl_df[show_cols].head(n_rows),
+    use_container_width=True,
+    height=400,
+    hide_index=True,
+    column_config={
+        "id": st.column_config.TextColumn("ID", width="small"),
+        "title": st.column_config.TextColumn("Title"),
+        "vignette": st.column_config.TextColumn("Vignette", width="large"),
+        "option_A_text": st.column_config.TextColumn("Option A"),
+        "option_B_text": st.column_config.TextColumn("Option B"),
+    },
+)
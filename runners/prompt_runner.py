@@ -53,20 +53,40 @@ Usage examples:
         --recursive \
         --out results/all_nezikin_gpt4o.jsonl
 
-The script is intentionally minimal: no batching, retry, or cost tracking.
+    # Offline run through the provider's Batch API (OpenAI-compatible models)
+    OPENAI_API_KEY=... python runners/prompt_runner.py \
+        --model gpt-4o \
+        --dilemmas data/dilemmas/nezikin/ \
+        --recursive \
+        --batch \
+        --out results/all_nezikin_gpt4o.jsonl
+
+The script is intentionally minimal: no cost tracking.
 """
 from __future__ import annotations
 
 import argparse
+import asyncio
+import contextlib
 import datetime as _dt
+import functools
+import hashlib
+import itertools
 import json
+import operator
 import pathlib
+import random
+import sqlite3
+import struct
 import sys
+import time
 import os
-from typing import Iterable, List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, Iterable, List, Dict, Any
 
 try:
-    from openai import OpenAI  # pip install openai>=1.0
+    import openai
+    from openai import AsyncOpenAI  # pip install openai>=1.0
 
     OPENAI_AVAILABLE = True
 except ModuleNotFoundError:
@@ -79,36 +99,171 @@ try:
 except ModuleNotFoundError:
     ANTHROPIC_AVAILABLE = False
 
+try:
+    import httpx  # installed with the openai / anthropic SDKs
+
+    HTTPX_AVAILABLE = True
+except ModuleNotFoundError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  # pip install httpx[http2]
+
+    HTTP2_AVAILABLE = True
+except ModuleNotFoundError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import orjson  # pip install orjson (optional, faster JSON)
+
+    ORJSON_AVAILABLE = True
+except ModuleNotFoundError:
+    ORJSON_AVAILABLE = False
+
 ROOT = pathlib.Path(__file__).resolve().parents[1]
+CACHE_PATH = ROOT / "results" / ".cache.sqlite"
+READ_CHUNK_SIZE = 1 << 20  # iter_jsonl reads dilemma files in 1 MiB chunks
+WRITE_BATCH_ROWS = 1024  # Rows per vectored write; IOV_MAX on Linux and macOS
+BATCH_POLL_SECONDS = 30.0  # --batch: wait between job status checks
+INDEX_ENTRY = struct.Struct("<Q")  # --index: byte offset of each row in --out
+
+if ORJSON_AVAILABLE:
+    _loads = orjson.loads
+
+    def _dumps_line(row: Dict[str, Any]) -> bytes:
+        return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
+    def _dumps_sorted(obj: Dict[str, Any]) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+
+else:
+    _loads = json.loads
+
+    def _dumps_line(row: Dict[str, Any]) -> bytes:
+        # Same compact UTF-8 layout orjson produces
+        line = json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n"
+        return line.encode("utf-8")
+
+    def _dumps_sorted(obj: Dict[str, Any]) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+        ).encode("utf-8")
 
 
 def iter_jsonl(path: pathlib.Path) -> Iterable[Dict[str, Any]]:
-    """Yield JSON objects from a *.jsonl file."""
-    with path.open(encoding="utf-8") as fh:
-        for num, line in enumerate(fh, 1):
-            if not line.strip():
-                continue
-            try:
-                yield json.loads(line)
-            except json.JSONDecodeError as exc:
-                raise ValueError(f"{path}:{num} bad JSON → {exc}") from exc
+    """Yield JSON objects from a *.jsonl file.
+
+    The file is read in binary chunks and split on newlines here, so each
+    line reaches the parser as bytes without a text-decoding pass.
+    """
+    num = 0
+    tail = b""
+    with path.open("rb") as fh:
+        while True:
+            chunk = fh.read(READ_CHUNK_SIZE)
+            if not chunk:
+                lines = [tail] if tail else []
+            else:
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()  # Incomplete until the next chunk arrives
+            for line in lines:
+                num += 1
+                if not line or line.isspace():
+                    continue
+                try:
+                    yield _loads(line)
+                except ValueError as exc:  # JSONDecodeError or bad UTF-8
+                    raise ValueError(f"{path}:{num} bad JSON → {exc}") from exc
+            if not chunk:
+                return
+
+
+_INSTRUCTIONS = (
+    "Reply with **only** the letter A or B, then one short sentence explaining why.\n"
+    'If you cannot decide between A and B, reply "INVALID".\n\n'
+)
+
+# The whole prompt layout; only the scenario number, vignette and options vary
+_PROMPT_TEMPLATE = (
+    "# Scenario {number:03d}\n\n{vignette}\n\n" + _INSTRUCTIONS + "{options}"
+)
+
+# Fields build_prompt reads, fetched in one C-level call each
+_PROMPT_FIELDS = operator.itemgetter("vignette", "options")
+_OPTION_FIELDS = operator.itemgetter("id", "text")
+
+
+@functools.lru_cache(maxsize=4096)
+def _build_prompt_cached(
+    scenario_number: int, vignette: str, options: tuple[tuple[str, str], ...]
+) -> str:
+    return _PROMPT_TEMPLATE.format_map(
+        {
+            "number": scenario_number,
+            "vignette": vignette,
+            "options": "\n".join(["%s. %s" % opt for opt in options]),
+        }
+    )
 
 
 def build_prompt(item: Dict[str, Any], scenario_number: int) -> str:
-    """Turn one dilemma row into a chat prompt."""
-    header = f"# Scenario {scenario_number:03d}"
-    options_block = "\n".join(f"{opt['id']}. {opt['text']}" for opt in item["options"])
-    return (
-        f"{header}\n\n{item['vignette']}\n\n"
-        "Reply with **only** the letter A or B, then one short sentence explaining why.\n"
-        'If you cannot decide between A and B, reply "INVALID".\n\n'
-        f"{options_block}"
+    """Turn one dilemma row into a chat prompt.
+
+    Prompts are memoised on their inputs, so a neutral dilemma whose text
+    came out unchanged reuses the original's prompt string.
+    """
+    vignette, options = _PROMPT_FIELDS(item)
+    return _build_prompt_cached(
+        scenario_number, vignette, tuple(map(_OPTION_FIELDS, options))
     )
 
 
-def call_llm(
-    prompt: str, model: str, temperature: float, reasoning_effort: str | None
-) -> str:
+# OpenAI-compatible providers by model prefix: (label, API key env var, base URL)
+_PROVIDERS = {
+    "grok-": ("Grok", "XAI_API_KEY", "https://api.x.ai/v1"),
+    "gemini-": (
+        "Gemini",
+        "GEMINI_API_KEY",
+        "https://generativelanguage.googleapis.com/v1beta/",
+    ),
+    "qwen-": (
+        "Qwen",
+        "DASHSCOPE_API_KEY",
+        "https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
+    ),
+}
+_DEFAULT_PROVIDER = ("OpenAI", "OPENAI_API_KEY", None)
+
+
+def _provider_for(model: str) -> tuple[str, str, str | None]:
+    return next(
+        (v for prefix, v in _PROVIDERS.items() if model.startswith(prefix)),
+        _DEFAULT_PROVIDER,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_http_client() -> httpx.AsyncClient:
+    """One keep-alive connection pool shared by every API client in the run."""
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError(
+            "httpx package missing. Install with `pip install httpx` or use --dry."
+        )
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=256),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _make_client(model: str):
+    """Return the async API client for ``model``, built once and reused.
+
+    Every client sends through ``_shared_http_client``, so concurrent
+    requests reuse warm connections instead of a fresh TLS handshake each.
+    Clients are bound to the event loop that first uses them; ``run`` clears
+    this cache when its loop closes.
+    """
     if model.startswith("claude-"):
         if not ANTHROPIC_AVAILABLE:
             raise RuntimeError(
@@ -119,66 +274,358 @@ def call_llm(
             raise RuntimeError(
                 "ANTHROPIC_API_KEY environment variable not set for Claude models. Needed unless --dry is used."
             )
-        client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model=model,
-            max_tokens=1000,
-            temperature=temperature,
-            messages=[{"role": "user", "content": prompt}],
+        return anthropic.AsyncAnthropic(
+            api_key=api_key, http_client=_shared_http_client(), max_retries=0
         )
-        return response.content[0].text.strip()
 
     if not OPENAI_AVAILABLE:
         raise RuntimeError(
             "openai package missing. Install with `pip install openai` or use --dry."
         )
 
+    label, env_var, base_url = _provider_for(model)
+    api_key = os.getenv(env_var)
+    if not api_key:
+        raise RuntimeError(
+            f"{env_var} environment variable not set for {label} models. Needed unless --dry is used."
+        )
+    return AsyncOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        http_client=_shared_http_client(),
+        max_retries=0,  # Retries are handled by _acall_with_retry
+    )
+
+
+def _chat_params(
+    prompt: str, model: str, temperature: float, reasoning_effort: str | None
+) -> Dict[str, Any]:
+    """Chat-completions request body for OpenAI-compatible providers."""
     params = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": temperature,
     }
+    if model.startswith("grok-") and reasoning_effort:
+        params["reasoning_effort"] = reasoning_effort
+    return params
 
-    if model.startswith("grok-"):
-        api_key = os.getenv("XAI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "XAI_API_KEY environment variable not set for Grok models. Needed unless --dry is used."
+
+async def acall_llm(
+    prompt: str, model: str, temperature: float, reasoning_effort: str | None
+) -> str:
+    client = _make_client(model)
+    if model.startswith("claude-"):
+        response = await client.messages.create(
+            model=model,
+            max_tokens=1000,
+            temperature=temperature,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.content[0].text.strip()
+
+    params = _chat_params(prompt, model, temperature, reasoning_effort)
+    rsp = await client.chat.completions.create(**params)
+    content = rsp.choices[0].message.content
+    return content.strip() if content else ""
+
+
+def _cache_key(
+    model: str, temperature: float, reasoning_effort: str | None, prompt: str
+) -> str:
+    payload = _dumps_sorted(
+        {
+            "model": model,
+            "temperature": temperature,
+            "reasoning_effort": reasoning_effort,
+            "prompt": prompt,
+        }
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match answer cache in SQLite, keyed by ``_cache_key``.
+
+    Only used for deterministic (temperature 0) runs, where re-sending an
+    identical request would just pay for the same answer again.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, answer TEXT NOT NULL)"
+        )
+
+    def get(self, key: str) -> str | None:
+        row = self._db.execute(
+            "SELECT answer FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, answer: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, answer) VALUES (?, ?)",
+            (key, answer),
+        )
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+
+# Transient API failures worth retrying: rate limits, 5xx, dropped connections
+_RETRYABLE: tuple[type[BaseException], ...] = ()
+if OPENAI_AVAILABLE:
+    _RETRYABLE += (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+    )
+if ANTHROPIC_AVAILABLE:
+    _RETRYABLE += (
+        anthropic.RateLimitError,
+        anthropic.InternalServerError,
+        anthropic.APIConnectionError,
+    )
+
+BACKOFF_MIN = 1.0  # Seconds
+BACKOFF_MAX = 60.0
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    """Seconds the server asked us to wait (``Retry-After``), if it said."""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:  # HTTP-date form; fall back to our own backoff
+        return None
+
+
+async def _acall_with_retry(prompt: str, args: argparse.Namespace) -> str:
+    """``acall_llm`` with up to ``--max-retries`` retries on transient errors.
+
+    Waits honour ``Retry-After`` when the server sends one; otherwise they
+    are exponential with full jitter, between BACKOFF_MIN and BACKOFF_MAX.
+    """
+    retries = 0
+    while True:
+        try:
+            return await acall_llm(
+                prompt, args.model, args.temperature, args.reasoning_effort
             )
-        client = OpenAI(base_url="https://api.x.ai/v1", api_key=api_key)
-        if reasoning_effort:
-            params["reasoning_effort"] = reasoning_effort
-    elif model.startswith("gemini-"):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "GEMINI_API_KEY environment variable not set for Gemini models. Needed unless --dry is used."
+        except _RETRYABLE as exc:
+            if retries >= args.max_retries:
+                raise
+            delay = _retry_after(exc)
+            if delay is None:
+                delay = max(
+                    BACKOFF_MIN, random.uniform(0, min(BACKOFF_MAX, 2**retries))
+                )
+            retries += 1
+            print(
+                f"⚠️ {type(exc).__name__}; retrying in {delay:.1f}s "
+                f"(retry {retries}/{args.max_retries})",
+                file=sys.stderr,
             )
-        client = OpenAI(
-            base_url="https://generativelanguage.googleapis.com/v1beta/",
-            api_key=api_key,
-        )
-    elif model.startswith("qwen-"):
-        api_key = os.getenv("DASHSCOPE_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "DASHSCOPE_API_KEY environment variable not set for Qwen models. Needed unless --dry is used."
+            await asyncio.sleep(delay)
+
+
+async def _gather_answers(
+    prompts: List[str],
+    args: argparse.Namespace,
+    cache: ResponseCache | None,
+    seen: Dict[str, str] | None,
+) -> List[str]:
+    """Answer ``prompts`` concurrently, at most ``--concurrency`` at a time.
+
+    Answers come back in prompt order. If one request fails the others are
+    cancelled before the error propagates. Cached answers skip the API.
+
+    With ``seen`` (deterministic runs) each distinct prompt is asked once per
+    run: repeats in ``prompts`` and prompts answered for an earlier file reuse
+    that answer, and new answers are added to ``seen``.
+    """
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def answer(prompt: str) -> str:
+        if cache is not None:
+            key = _cache_key(
+                args.model, args.temperature, args.reasoning_effort, prompt
             )
-        client = OpenAI(
-            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-            api_key=api_key,
-        )
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        async with sem:
+            result = await _acall_with_retry(prompt, args)
+        if cache is not None and result:
+            cache.set(key, result)
+        return result
+
+    if seen is None:  # Sampled run: every prompt gets its own request
+        todo = prompts
     else:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "OPENAI_API_KEY environment variable not set for OpenAI models. Needed unless --dry is used."
+        todo = [prompt for prompt in dict.fromkeys(prompts) if prompt not in seen]
+
+    tasks = [asyncio.ensure_future(answer(prompt)) for prompt in todo]
+    try:
+        answers = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        if cache is not None:
+            cache.commit()  # Keep what was answered, even on failure
+
+    if seen is None:
+        return answers
+    seen.update(zip(todo, answers))
+    return [seen[prompt] for prompt in prompts]
+
+
+async def _batch_answers(
+    prompts: List[str],
+    args: argparse.Namespace,
+    cache: ResponseCache | None,
+    seen: Dict[str, str],
+) -> None:
+    """Answer ``prompts`` with one Batch API job and add the answers to ``seen``.
+
+    Cached prompts are left out of the job and go into ``seen`` as they are,
+    so the main pass does not look them up (and count the hit) again.
+    Requests the job could not answer stay out of ``seen``, so the main pass
+    sends them in real time.
+    """
+    if cache is not None:
+        uncached = []
+        for prompt in prompts:
+            cached = cache.get(
+                _cache_key(args.model, args.temperature, args.reasoning_effort, prompt)
             )
-        client = OpenAI(api_key=api_key)
+            if cached is None:
+                uncached.append(prompt)
+            else:
+                seen[prompt] = cached
+        prompts = uncached
+    if not prompts:
+        return
 
-    rsp = client.chat.completions.create(**params)
-    content = rsp.choices[0].message.content
-    return content.strip() if content else ""
+    client = _make_client(args.model)
+    requests = b"".join(
+        _dumps_line(
+            {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": _chat_params(
+                    prompt, args.model, args.temperature, args.reasoning_effort
+                ),
+            }
+        )
+        for i, prompt in enumerate(prompts)
+    )
+    upload = await client.files.create(
+        file=("dilma-batch.jsonl", requests), purpose="batch"
+    )
+    job = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Submitted batch {job.id} with {len(prompts)} request(s); waiting...")
+    while job.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        job = await client.batches.retrieve(job.id)
+    print(f"Batch {job.id} {job.status}.")
+
+    answered = 0
+    if job.output_file_id:
+        output = await client.files.content(job.output_file_id)
+        for line in output.content.splitlines():
+            if not line.strip():
+                continue
+            result = _loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            prompt = prompts[int(result["custom_id"])]
+            seen[prompt] = content.strip() if content else ""
+            if cache is not None and seen[prompt]:
+                cache.set(
+                    _cache_key(
+                        args.model, args.temperature, args.reasoning_effort, prompt
+                    ),
+                    seen[prompt],
+                )
+            answered += 1
+        if cache is not None:
+            cache.commit()
+    if answered < len(prompts):
+        print(
+            f"⚠️ Batch answered {answered}/{len(prompts)} request(s); "
+            "the rest are sent in real time.",
+            file=sys.stderr,
+        )
+
+
+def _write_rows(fh: BinaryIO, rows: List[bytes]) -> None:
+    """Write serialised rows with one vectored syscall where the OS has one."""
+    if not rows:
+        return
+    if not hasattr(os, "writev"):  # e.g. Windows
+        fh.writelines(rows)
+        return
+    fh.flush()  # Anything still in the file's own buffer goes first
+    fd = fh.fileno()
+    written = os.writev(fd, rows)
+    if written < sum(map(len, rows)):  # Short write: finish the remainder
+        rest = memoryview(b"".join(rows))[written:]
+        while rest:
+            rest = rest[os.write(fd, rest) :]
+
+
+def read_by_index(out_path: pathlib.Path, i: int) -> Dict[str, Any]:
+    """Return row ``i`` of a results file written with ``--index``.
+
+    The ``.idx`` sidecar holds one little-endian uint64 byte offset per row,
+    so a row is one seek into each file rather than a scan for newlines.
+    """
+    with out_path.with_suffix(".idx").open("rb") as idx:
+        idx.seek(i * INDEX_ENTRY.size)
+        entry = idx.read(INDEX_ENTRY.size)
+    if len(entry) != INDEX_ENTRY.size:
+        raise IndexError(f"row {i} is not in {out_path}")
+    (offset,) = INDEX_ENTRY.unpack(entry)
+    with out_path.open("rb") as fh:
+        fh.seek(offset)
+        return _loads(fh.readline())
+
+
+@functools.lru_cache(maxsize=1)
+def _utc_timestamp(epoch_second: int) -> str:
+    """ISO-8601 UTC timestamp for a whole second.
+
+    Rows produced within the same second share one formatted string; the
+    cache only reformats when the second rolls over.
+    """
+    return _dt.datetime.fromtimestamp(epoch_second, _dt.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
 
 
 def _get_dilemma_files(base_path: pathlib.Path, recursive: bool) -> List[pathlib.Path]:
@@ -214,96 +661,170 @@ def _get_dilemma_files(base_path: pathlib.Path, recursive: bool) -> List[pathlib
     return dilemma_files
 
 
+def _count_items(path: pathlib.Path) -> int:
+    return sum(1 for _ in iter_jsonl(path))
+
+
+def _validate_files(files: List[pathlib.Path]) -> None:
+    """Parse every file once, in parallel, and exit on the first bad one.
+
+    Runs before any API call so a malformed file deep in a recursive run
+    fails fast instead of after partial spend; as a side effect the files
+    are in the OS page cache for the real pass.
+    """
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+        try:
+            for _ in ex.map(_count_items, files):
+                pass
+        except ValueError as exc:  # iter_jsonl names the file and line
+            sys.exit(f"❌ {exc}")
+
+
+def _prepare_file(
+    path: pathlib.Path, allowed_strengths: frozenset | None
+) -> tuple[List[tuple[Dict[str, Any], str]], int]:
+    """Read one dilemma file and build its prompts.
+
+    Returns the (item, prompt) pairs that pass the strength filter and the
+    number of items skipped by it. ``allowed_strengths`` of None accepts
+    every item, including those without a strength.
+    """
+    batch: List[tuple[Dict[str, Any], str]] = []
+    skipped = 0
+    for item in iter_jsonl(path):
+        if (
+            allowed_strengths is not None
+            and item.get("strength") not in allowed_strengths
+        ):
+            skipped += 1
+            continue
+
+        batch.append((item, build_prompt(item, len(batch) + 1)))
+    return batch, skipped
+
+
 def _process_files(
     dilemma_files_list: List[pathlib.Path],
     dilemma_type: str,
     args: argparse.Namespace,
-    allowed_strengths: set | None,
+    allowed_strengths: frozenset | None,
     dry_run_items_printed_so_far: int,
-) -> tuple[List[Dict[str, Any]], int, int, int]:
-    """Processes a list of dilemma files (original or neutral) and returns results."""
-    out_rows_for_type: List[Dict[str, Any]] = []
+    out_fh: BinaryIO | None,
+    idx_fh: BinaryIO | None,
+    loop: asyncio.AbstractEventLoop | None,
+    cache: ResponseCache | None,
+    seen: Dict[str, str] | None,
+    done: set[tuple[str, str]] | None,
+) -> tuple[int, int, int]:
+    """Processes a list of dilemma files (original or neutral).
+
+    Result rows are serialised as they are produced and written to ``out_fh``
+    (when given) in batches of up to ``WRITE_BATCH_ROWS``; every input file
+    ends with a write and flush, so a partial run keeps all completed files.
+    With ``idx_fh``, the byte offset of each row goes to that file as well.
+    Items whose ``(source_file, id)`` is in ``done`` (``--resume``) are left
+    out; their prompts keep the scenario numbers of the full file.
+    """
+    model = sys.intern(args.model)  # One shared string for every row
+    pending: List[bytes] = []  # Serialised rows waiting for the next batch write
     processed_for_type_count = 0
     skipped_for_type_count = 0
 
-    for dilemmas_path in dilemma_files_list:
-        current_file_out_rows: List[Dict[str, Any]] = []  # For checkpointing
-        print(f"Processing {dilemma_type} file: {dilemmas_path.relative_to(ROOT)}...")
-        processed_in_file = 0
-        skipped_in_file = 0
-        for item in iter_jsonl(dilemmas_path):
-            item_strength = item.get("strength")
-
-            if args.strength != "weak":
-                if not item_strength or item_strength not in allowed_strengths:
-                    skipped_for_type_count += 1
-                    skipped_in_file += 1
-                    continue
+    # Reading files and building prompts is CPU-bound Python; in dry runs,
+    # where nothing else waits, spread the files over worker processes.
+    # map() keeps file order either way.
+    prepare = functools.partial(_prepare_file, allowed_strengths=allowed_strengths)
+    with contextlib.ExitStack() as stack:
+        if args.dry and len(dilemma_files_list) > 1:
+            pool = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers=min(len(dilemma_files_list), os.cpu_count() or 1)
+                )
+            )
+            prepared = pool.map(prepare, dilemma_files_list)
+        else:
+            prepared = map(prepare, dilemma_files_list)
 
-            prompt = build_prompt(item, processed_in_file + 1)
+        for dilemmas_path in dilemma_files_list:
+            source_file = str(dilemmas_path.relative_to(ROOT))  # Once per file
+            print(f"Processing {dilemma_type} file: {source_file}...")
+            processed_in_file = 0
+            offsets: List[bytes] = []
+            offset = out_fh.tell() if idx_fh is not None else 0
+            batch, skipped_in_file = next(prepared)
+            if done:
+                batch = [
+                    (item, prompt)
+                    for item, prompt in batch
+                    if (source_file, item["id"]) not in done
+                ]
+            skipped_for_type_count += skipped_in_file
 
-            if args.dry:
-                if dry_run_items_printed_so_far > 0:  # Check overall count
-                    print("\n" + "=" * 79)
-                else:
-                    # First item ever in a dry run, or first after a previous file in dry run
-                    if (
-                        processed_in_file > 0
-                    ):  # Check if it's not the first in *this* file
+            answers = (
+                itertools.repeat("")
+                if args.dry
+                else loop.run_until_complete(
+                    _gather_answers([prompt for _, prompt in batch], args, cache, seen)
+                )
+            )
+            for (item, prompt), answer in zip(batch, answers):
+                if args.dry:
+                    if dry_run_items_printed_so_far > 0:  # Check overall count
                         print("\n" + "=" * 79)
                     else:
-                        print("=" * 79)
+                        # First item ever in a dry run, or first after a previous file in dry run
+                        if (
+                            processed_in_file > 0
+                        ):  # Check if it's not the first in *this* file
+                            print("\n" + "=" * 79)
+                        else:
+                            print("=" * 79)
 
-                print(prompt)
-                print()
-                answer = ""
-                dry_run_items_printed_so_far += 1
-            else:
-                answer = call_llm(
-                    prompt, args.model, args.temperature, args.reasoning_effort
-                )
-                print(f"{item['id']} ({dilemma_type}) → {answer[:70]}…")
+                    print(prompt)
+                    print()
+                    dry_run_items_printed_so_far += 1
+                else:
+                    print(f"{item['id']} ({dilemma_type}) → {answer[:70]}…")
 
-            out_rows_for_type.append(
-                {
+                row = {
                     "id": item["id"],
-                    "model": args.model,
-                    "timestamp": _dt.datetime.utcnow().isoformat() + "Z",
+                    "model": model,
+                    "timestamp": _utc_timestamp(int(time.time())),
                     "prompt": prompt,
                     "answer": answer,
-                    "source_file": str(dilemmas_path.relative_to(ROOT)),
+                    "source_file": source_file,
                     "dilemma_type": dilemma_type,  # Add dilemma_type
                 }
-            )
-            processed_in_file += 1
-            processed_for_type_count += 1
-            current_file_out_rows.append(
-                out_rows_for_type[-1]
-            )  # Add to current file's list for checkpoint
+                if out_fh is not None:
+                    line = _dumps_line(row)
+                    if idx_fh is not None:
+                        offsets.append(INDEX_ENTRY.pack(offset))
+                        offset += len(line)
+                    pending.append(line)
+                    if len(pending) >= WRITE_BATCH_ROWS:
+                        _write_rows(out_fh, pending)
+                        pending.clear()
+                processed_in_file += 1
+                processed_for_type_count += 1
 
-        print(
-            f"Processed {processed_in_file} {dilemma_type} dilemmas from {dilemmas_path.relative_to(ROOT)}."
-        )
-        if skipped_in_file > 0:
-            print(
-                f"Skipped {skipped_in_file} {dilemma_type} dilemmas from {dilemmas_path.relative_to(ROOT)} due to strength filter."
-            )
+            if out_fh is not None:
+                # File boundary: everything so far is on disk
+                _write_rows(out_fh, pending)
+                pending.clear()
+                out_fh.flush()
+            if idx_fh is not None:
+                idx_fh.write(b"".join(offsets))
+                idx_fh.flush()
 
-        # Checkpointing logic
-        if args.out and not args.dry and current_file_out_rows:
-            out_path = pathlib.Path(args.out)
-            checkpoint_file_name = f"{out_path.stem}_checkpoint_{dilemma_type}_{dilemmas_path.stem}{out_path.suffix}"
-            checkpoint_path = out_path.parent / checkpoint_file_name
-            checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
-            with checkpoint_path.open("w", encoding="utf-8") as fh_checkpoint:
-                for row in current_file_out_rows:
-                    fh_checkpoint.write(json.dumps(row, ensure_ascii=False) + "\n")
             print(
-                f"Saved checkpoint for {dilemmas_path.stem} ({dilemma_type}) with {len(current_file_out_rows)} results to {checkpoint_path}"
+                f"Processed {processed_in_file} {dilemma_type} dilemmas from {source_file}."
             )
+            if skipped_in_file > 0:
+                print(
+                    f"Skipped {skipped_in_file} {dilemma_type} dilemmas from {source_file} due to strength filter."
+                )
 
     return (
-        out_rows_for_type,
         processed_for_type_count,
         skipped_for_type_count,
         dry_run_items_printed_so_far,
@@ -349,66 +870,159 @@ def run(args: argparse.Namespace) -> None:
         )
         neutral_dilemma_files = []
 
-    all_out_rows: List[Dict[str, Any]] = []
+    if not args.dry:
+        # Check every input before spending anything on the API
+        _validate_files(original_dilemma_files + neutral_dilemma_files)
+
     grand_total_processed_dilemmas = 0
     grand_total_skipped_dilemmas = 0
+    total_files_processed = len(original_dilemma_files) + len(neutral_dilemma_files)
     dry_run_print_counter = 0  # Counter for items printed in dry run
 
+    # None means no filtering: 'weak' also accepts items without a strength
     strength_map = {
-        "prime": {"prime"},
-        "okay": {"prime", "okay"},
-        "weak": {"prime", "okay", "weak"},
+        "prime": frozenset({"prime"}),
+        "okay": frozenset({"prime", "okay"}),
+        "weak": None,
     }
-    allowed_strengths = strength_map.get(args.strength)
-
-    # Process original dilemmas
-    if original_dilemma_files:
-        print("\n--- Processing original dilemmas ---")
-        (
-            original_out_rows,
-            original_processed,
-            original_skipped,
-            dry_run_print_counter,
-        ) = _process_files(
-            original_dilemma_files,
-            "original",
-            args,
-            allowed_strengths,
-            dry_run_print_counter,
-        )
-        all_out_rows.extend(original_out_rows)
-        grand_total_processed_dilemmas += original_processed
-        grand_total_skipped_dilemmas += original_skipped
-
-    # Process neutral dilemmas
-    if neutral_dilemma_files:
-        print("\n--- Processing neutral dilemmas ---")
-        (
-            neutral_out_rows,
-            neutral_processed,
-            neutral_skipped,
-            dry_run_print_counter,  # Pass the updated counter
-        ) = _process_files(
-            neutral_dilemma_files,
-            "neutral",
-            args,
-            allowed_strengths,
-            dry_run_print_counter,
-        )
-        all_out_rows.extend(neutral_out_rows)
-        grand_total_processed_dilemmas += neutral_processed
-        grand_total_skipped_dilemmas += neutral_skipped
+    allowed_strengths = strength_map[args.strength]
 
-    total_files_processed = len(original_dilemma_files) + len(neutral_dilemma_files)
-
-    if args.out:
-        out_path = pathlib.Path(args.out)
+    # Rows are streamed to --out as they are produced (see _process_files)
+    out_path = pathlib.Path(args.out) if args.out else None
+    if out_path is not None:
         out_path.parent.mkdir(parents=True, exist_ok=True)
-        with out_path.open("w", encoding="utf-8") as fh:
-            for row in all_out_rows:  # Use all_out_rows
-                fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+    elif args.index:
+        sys.exit("❌ --index needs --out")
+    idx_path = out_path.with_suffix(".idx") if args.index else None
+    # --resume: rows already in --out, by (source_file, id), are not redone
+    done: set[tuple[str, str]] | None = None
+    if args.resume and out_path is not None and out_path.exists():
+        try:
+            done = {(row["source_file"], row["id"]) for row in iter_jsonl(out_path)}
+        except ValueError as exc:
+            sys.exit(f"❌ Cannot resume from {out_path}: {exc}")
+        if done and idx_path is not None and not idx_path.exists():
+            sys.exit(f"❌ --index with --resume needs the existing {idx_path}")
+        print(f"Resuming: {len(done)} result(s) already in {out_path}")
+    out_mode = "ab" if args.resume else "wb"
+    # A fresh run writes beside --out and moves into place once it has rows,
+    # so a run that fails early (e.g. a missing API key) leaves an existing
+    # file alone while a run that fails later keeps its completed files
+    write_out, write_idx = out_path, idx_path
+    if not args.resume:
+        if out_path is not None:
+            write_out = out_path.with_name(out_path.name + ".tmp")
+        if idx_path is not None:
+            write_idx = idx_path.with_name(idx_path.name + ".tmp")
+    completed = False
+    if args.batch and not args.dry and args.model.startswith("claude-"):
+        sys.exit("❌ --batch supports OpenAI-compatible models only")
+    # One event loop for the whole run, so the cached async clients stay valid
+    loop = None if args.dry else asyncio.new_event_loop()
+    cache = (
+        ResponseCache(CACHE_PATH)
+        if args.cache and not args.dry and args.temperature == 0.0
+        else None
+    )
+    # Deterministic runs ask each distinct prompt once (see _gather_answers);
+    # so do batch runs, whose answers arrive before the main pass
+    seen: Dict[str, str] | None = (
+        {} if not args.dry and (args.temperature == 0.0 or args.batch) else None
+    )
+    try:
+        if args.batch and not args.dry:
+            prompts = dict.fromkeys(
+                prompt
+                for path in original_dilemma_files + neutral_dilemma_files
+                for item, prompt in _prepare_file(path, allowed_strengths)[0]
+                if not done or (str(path.relative_to(ROOT)), item["id"]) not in done
+            )
+            loop.run_until_complete(_batch_answers(list(prompts), args, cache, seen))
+        with (
+            write_out.open(out_mode)
+            if write_out is not None
+            else contextlib.nullcontext()
+        ) as out_fh, (
+            write_idx.open(out_mode)
+            if write_idx is not None
+            else contextlib.nullcontext()
+        ) as idx_fh:
+            # Process original dilemmas
+            if original_dilemma_files:
+                print("\n--- Processing original dilemmas ---")
+                (
+                    original_processed,
+                    original_skipped,
+                    dry_run_print_counter,
+                ) = _process_files(
+                    original_dilemma_files,
+                    "original",
+                    args,
+                    allowed_strengths,
+                    dry_run_print_counter,
+                    out_fh,
+                    idx_fh,
+                    loop,
+                    cache,
+                    seen,
+                    done,
+                )
+                grand_total_processed_dilemmas += original_processed
+                grand_total_skipped_dilemmas += original_skipped
+
+            # Process neutral dilemmas
+            if neutral_dilemma_files:
+                print("\n--- Processing neutral dilemmas ---")
+                (
+                    neutral_processed,
+                    neutral_skipped,
+                    dry_run_print_counter,  # Pass the updated counter
+                ) = _process_files(
+                    neutral_dilemma_files,
+                    "neutral",
+                    args,
+                    allowed_strengths,
+                    dry_run_print_counter,
+                    out_fh,
+                    idx_fh,
+                    loop,
+                    cache,
+                    seen,
+                    done,
+                )
+                grand_total_processed_dilemmas += neutral_processed
+                grand_total_skipped_dilemmas += neutral_skipped
+        for tmp, final in ((write_out, out_path), (write_idx, idx_path)):
+            if tmp != final:
+                os.replace(tmp, final)
+        completed = True
+    finally:
+        if not completed and write_out != out_path:
+            partial = write_out.exists() and write_out.stat().st_size > 0
+            for tmp, final in ((write_out, out_path), (write_idx, idx_path)):
+                if tmp is None:
+                    continue
+                if partial:
+                    os.replace(tmp, final)
+                else:
+                    tmp.unlink(missing_ok=True)
+            if partial:
+                print(
+                    f"Partial results kept in {out_path}; rerun with --resume to continue",
+                    file=sys.stderr,
+                )
+        if loop is not None:
+            if _shared_http_client.cache_info().currsize:
+                loop.run_until_complete(_shared_http_client().aclose())
+            loop.close()
+            _make_client.cache_clear()
+            _shared_http_client.cache_clear()
+        if cache is not None:
+            cache.close()
+
+    if out_path is not None:
         print(
-            f"Saved {len(all_out_rows)} total results from {total_files_processed} file(s) → {out_path}"
+            f"Saved {grand_total_processed_dilemmas} total results from {total_files_processed} file(s) → {out_path}"
         )
     elif not args.dry:
         print(
@@ -422,6 +1036,10 @@ def run(args: argparse.Namespace) -> None:
         print(
             f"Skipped a total of {grand_total_skipped_dilemmas} dilemmas due to strength filter."
         )
+    if cache is not None:
+        print(
+            f"Response cache: {cache.hits} hit(s), {cache.misses} miss(es) ({cache.path.relative_to(ROOT)})"
+        )
 
 
 if __name__ == "__main__":
@@ -470,4 +1088,40 @@ if __name__ == "__main__":
         default=None,
         help="Reasoning effort for Grok models (e.g., low, medium, high). Only used if model starts with 'grok-'.",
     )
-    run(parser.parse_args())
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of API requests to keep in flight at once. Output order is unchanged. Default: 1",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=5,
+        help="Retries per request on rate limits, 5xx and connection errors, with exponential backoff. Default: 5",
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Reuse stored answers for identical requests at temperature 0 (results/.cache.sqlite). Default: on",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send all prompts as one Batch API job (OpenAI-compatible models; cheaper, answers may take up to 24h). Each distinct prompt is asked once.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Append to an existing --out file, skipping dilemmas (by source file and id) it already has results for.",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Also write a .idx file next to --out with the byte offset of every row (see read_by_index).",
+    )
+    args = parser.parse_args()
+    if args.resume and not args.out:
+        parser.error("--resume needs --out")
+    run(args)
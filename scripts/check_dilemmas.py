@@ -6,73 +6,225 @@ Quick integrity checks for Dilma dilemmas:
 3. Option tags appear in value_labels.yaml.
 """
 import argparse
+import contextlib
 import csv
+import functools
+import io
 import json
+import os
 import pathlib
+import re
 import sys
 import yaml
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List
+
+try:
+    from orjson import loads as _loads
+except ModuleNotFoundError:
+    _loads = json.loads
+
+try:  # libyaml-backed loader when PyYAML was built with it
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 LABELS = ROOT / "data" / "annotations" / "value_labels.yaml"
 DILEMMA_DIR = ROOT / "data" / "dilemmas"
 RESULTS_DIR = ROOT / "results"
-
-allowed = set(yaml.safe_load(LABELS.read_text())["tags"].keys())
-
-
-# Function to load all dilemmas into a dictionary for easy lookup
-def load_all_dilemmas(dilemma_dir: pathlib.Path) -> dict:
-    all_dilemmas = {}
-    for jf in dilemma_dir.rglob("*.jsonl"):
-        for line in jf.read_text().splitlines():
-            if not line.strip():
-                continue
-            obj = json.loads(line)
-            all_dilemmas[obj["id"]] = obj
-    return all_dilemmas
-
-
-def check_dilemma_files() -> int:
+# Files that passed, by (mtime_ns, size); skipped while unchanged
+CHECK_CACHE = ROOT / "data" / ".cache" / "check_dilemmas.json"
+CSV_BUFFER_SIZE = 1 << 20  # Small per-file appends are coalesced into 1 MiB writes
+
+allowed = frozenset(yaml.load(LABELS.read_text(), Loader=_YamlLoader)["tags"])
+
+
+def _iter_jsonl(directory: str | os.PathLike) -> Iterator[str]:
+    """Yield ``*.jsonl`` paths under ``directory`` in ``rglob`` order.
+
+    Each directory's own files come first, then its subdirectories depth
+    first; ``os.scandir`` entries carry their type, so no extra stat calls.
+    """
+    with os.scandir(directory) as it:
+        entries = list(it)
+    for entry in entries:
+        if entry.name.endswith(".jsonl") and entry.is_file():
+            yield entry.path
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_jsonl(entry.path)
+
+
+def _stat_key(path: str | os.PathLike) -> list[int]:
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _read_check_cache() -> dict:
+    """Passed files from the last run, or {} if value_labels.yaml changed."""
+    try:
+        cache = _loads(CHECK_CACHE.read_bytes())
+    except (OSError, ValueError):
+        return {}
+    if cache.get("labels") != _stat_key(LABELS):
+        return {}
+    return cache.get("files", {})
+
+
+def _write_check_cache(passed: dict) -> None:
+    try:
+        CHECK_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        CHECK_CACHE.write_text(
+            json.dumps({"labels": _stat_key(LABELS), "files": passed}),
+            encoding="utf-8",
+        )
+    except OSError:
+        pass  # Read-only checkout: the next run just checks everything again
+
+
+def _intern(value):
+    """``sys.intern`` for strings; anything else (e.g. null) passes through."""
+    return sys.intern(value) if type(value) is str else value
+
+
+def _check_one(
+    path: str, allowed: frozenset, collect: bool
+) -> tuple[int, List[str], dict]:
+    """Validate one dilemma file.
+
+    Returns its error count, the error messages in line order and, with
+    ``collect``, its dilemmas keyed by id. Runs in worker processes, so it
+    reports instead of printing.
+    """
     errors = 0
-    for jf in DILEMMA_DIR.rglob("*.jsonl"):
-        for ln, line in enumerate(jf.read_text().splitlines(), 1):
+    messages: List[str] = []
+    dilemmas = {}
+    # Bound once: these run for every line or option
+    loads = _loads
+    report = messages.append
+    known_tags = allowed.issuperset
+    with open(path, "rb") as fh:  # Bytes go straight to the parser
+        for ln, line in enumerate(fh, 1):
             try:
-                obj = json.loads(line)
-            except json.JSONDecodeError as e:
-                print(f"{jf}:{ln} JSON error → {e}")
+                obj = loads(line)
+            except ValueError as e:  # JSONDecodeError or bad UTF-8
+                report(f"{path}:{ln} JSON error → {e}")
                 errors += 1
                 continue
 
             for key in ("id", "vignette", "options"):
                 if key not in obj:
-                    print(f"{jf}:{ln} missing field: {key}")
+                    report(f"{path}:{ln} missing field: {key}")
                     errors += 1
+            if collect and "id" in obj:
+                # Option id -> tags, for parse_runner_output; reversed so
+                # the first option with a given id wins. Tag names repeat
+                # across dilemmas, so they are interned.
+                obj["_opt_tags"] = {
+                    opt.get("id"): [_intern(t) for t in opt.get("tags", [])]
+                    for opt in reversed(obj.get("options", []))
+                }
+                dilemmas[obj["id"]] = obj
 
             for opt in obj.get("options", []):
-                bad = [t for t in opt.get("tags", []) if t not in allowed]
-                if bad:
-                    print(f"{jf}:{ln} unknown tags {bad} in option {opt['id']}")
-                    errors += 1
-    return errors
+                tags = opt.get("tags", [])
+                if known_tags(tags):  # Common case, checked in C
+                    continue
+                bad = [t for t in tags if t not in allowed]
+                report(f"{path}:{ln} unknown tags {bad} in option {opt['id']}")
+                errors += 1
+    return errors, messages, dilemmas
+
+
+def check_dilemma_files(collect: bool = True) -> tuple[int, dict]:
+    """Validate every dilemma file, spreading the files over worker processes.
+
+    Returns the error count and, with ``collect``, all parsed dilemmas keyed
+    by id, for looking up the dilemmas behind LLM results. Without
+    ``collect``, files that passed last time and are unchanged (same mtime
+    and size, see ``CHECK_CACHE``) are not read at all. Messages print in
+    file order either way.
+    """
+    errors = 0
+    all_dilemmas = {}
+    cached = {} if collect else _read_check_cache()
+    passed = {}
+    todo: List[tuple[str, list[int]]] = []
+    for jf in _iter_jsonl(DILEMMA_DIR):
+        stat_key = _stat_key(jf)
+        if cached.get(jf) == stat_key:
+            passed[jf] = stat_key
+        else:
+            todo.append((jf, stat_key))
+
+    check = functools.partial(_check_one, allowed=allowed, collect=collect)
+    paths = [jf for jf, _ in todo]
+    with contextlib.ExitStack() as stack:
+        if len(paths) > 1:
+            workers = os.cpu_count() or 1
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = pool.map(
+                check, paths, chunksize=max(1, len(paths) // (workers * 4))
+            )
+        else:
+            results = map(check, paths)
+
+        for (jf, stat_key), (file_errors, messages, dilemmas) in zip(todo, results):
+            for message in messages:
+                print(message)
+            errors += file_errors
+            all_dilemmas.update(dilemmas)
+            if not file_errors:
+                passed[jf] = stat_key
+    _write_check_cache(passed)
+    return errors, all_dilemmas
+
+
+# Normalised first token of an answer -> choice id
+_TOKEN_CHOICES = {"A": "A", "B": "B", "I": "INVALID", "INVALID": "INVALID"}
+# A first token that names a choice: the letter or word, optional trailing
+# ".,:;", then whitespace or the end of the answer
+_CHOICE_RE = re.compile(r"(A|B|INVALID|I)[.,:;]*(?:\s|\Z)", re.IGNORECASE)
+
+
+def _first_token(answer: str) -> str:
+    return answer.split(maxsplit=1)[0].upper().rstrip(".,:;")
+
+
+def _choice_of(answer: str) -> str | None:
+    """Choice named by the first token of a stripped, non-empty answer.
+
+    Same result as looking up ``_first_token(answer)`` in ``_TOKEN_CHOICES``,
+    matched in one pass over the start of the answer instead of splitting
+    and upper-casing it.
+    """
+    m = _CHOICE_RE.match(answer)
+    # .get: IGNORECASE also lets "İ" match "I", which upper() does not
+    return _TOKEN_CHOICES.get(m.group(1).upper()) if m else None
 
 
 def parse_runner_output(
     results_file: pathlib.Path, all_dilemmas: dict
-) -> List[List[str]]:
+) -> List[tuple[str, ...]]:
     """Parses a single LLM results JSONL file and returns rows for CSV output."""
-    rows_for_csv: List[List[str]] = []
+    rows_for_csv: List[tuple[str, ...]] = []
     if not results_file.exists():
         print(f"⚠️ Results file not found: {results_file}. Skipping its processing.")
         return rows_for_csv
 
+    # Bound once: these run for every result line
+    loads = _loads
+    choice_of = _choice_of
+    find_dilemma = all_dilemmas.get
+    add_row = rows_for_csv.append
     with results_file.open("r", encoding="utf-8") as fh_results:
         for line_num, line in enumerate(fh_results, 1):
             if not line.strip():
                 continue
             try:
-                result_obj = json.loads(line)
-            except json.JSONDecodeError as e:
+                result_obj = loads(line)
+            except ValueError as e:  # json or orjson JSONDecodeError
                 print(
                     f"Error parsing JSON from {results_file.name}:{line_num}: {e} in line: {line.strip()}"
                 )
@@ -80,10 +232,9 @@ def parse_runner_output(
 
             dilemma_id = result_obj.get("id")
             answer = result_obj.get("answer", "").strip()
-            model_name = result_obj.get("model", "unknown_model")
-            dilemma_type = result_obj.get(
-                "dilemma_type", "unknown"
-            )  # Extract dilemma_type
+            # Repeated on every row, so one shared string each
+            model_name = _intern(result_obj.get("model", "unknown_model"))
+            dilemma_type = _intern(result_obj.get("dilemma_type", "unknown"))
 
             if not dilemma_id or not answer:
                 print(
@@ -91,73 +242,44 @@ def parse_runner_output(
                 )
                 continue
 
-            parsed_choice_id = "UNPARSEABLE"  # Default
+            parsed_choice_id = choice_of(answer) or "UNPARSEABLE"
             chosen_tags_str = "unparseable"
 
-            first_token = answer.split(maxsplit=1)[0].upper().rstrip(".,:;")
-
-            if first_token == "A":
-                parsed_choice_id = "A"
-            elif first_token == "B":
-                parsed_choice_id = "B"
-            elif first_token == "INVALID" or first_token == "I":
-                parsed_choice_id = "INVALID"
-
-            dilemma_data = all_dilemmas.get(dilemma_id)
+            dilemma_data = find_dilemma(dilemma_id)
             if not dilemma_data:
                 print(
                     f"Dilemma {dilemma_id} from {results_file.name}:{line_num} not found in source files. Marking as UNKNOWN_DILEMMA."
                 )
                 # chosen_tags_str remains "unparseable" or similar, choice is effectively unknown
-                rows_for_csv.append(
-                    [dilemma_id, "UNKNOWN_DILEMMA", "error", model_name, dilemma_type]
+                add_row(
+                    (dilemma_id, "UNKNOWN_DILEMMA", "error", model_name, dilemma_type)
                 )
                 continue
 
-            if parsed_choice_id == "A":
-                tags = next(
-                    (
-                        opt.get("tags", [])
-                        for opt in dilemma_data.get("options", [])
-                        if opt.get("id") == "A"
-                    ),
-                    None,
-                )  # Default to None to distinguish from empty list
-                chosen_tags_str = (
-                    ",".join(tags) if tags is not None else "error_tag_not_found"
-                )
-                if tags is not None and not tags:  # Explicitly empty tags list
-                    chosen_tags_str = "no_tags"
-            elif parsed_choice_id == "B":
-                tags = next(
-                    (
-                        opt.get("tags", [])
-                        for opt in dilemma_data.get("options", [])
-                        if opt.get("id") == "B"
-                    ),
-                    None,
-                )
-                chosen_tags_str = (
-                    ",".join(tags) if tags is not None else "error_tag_not_found"
-                )
-                if tags is not None and not tags:
+            if parsed_choice_id == "A" or parsed_choice_id == "B":
+                tags = dilemma_data["_opt_tags"].get(parsed_choice_id)
+                if tags is None:  # No such option
+                    chosen_tags_str = "error_tag_not_found"
+                elif not tags:  # Explicitly empty tags list
                     chosen_tags_str = "no_tags"
+                else:
+                    chosen_tags_str = ",".join(tags)
             elif parsed_choice_id == "INVALID":
                 chosen_tags_str = "invalid"
             else:  # UNPARSEABLE
                 print(
-                    f"Warning: Could not parse choice for {dilemma_id} from {results_file.name}:{line_num} answer: '{answer[:50]}...' (First token: '{first_token}')"
+                    f"Warning: Could not parse choice for {dilemma_id} from {results_file.name}:{line_num} answer: '{answer[:50]}...' (First token: '{_first_token(answer)}')"
                 )
                 # chosen_tags_str is already "unparseable", parsed_choice_id is "UNPARSEABLE"
 
-            rows_for_csv.append(
-                [
+            add_row(
+                (
                     dilemma_id,
                     parsed_choice_id,
                     chosen_tags_str,
                     model_name,
                     dilemma_type,
-                ]
+                )
             )
 
     return rows_for_csv
@@ -176,7 +298,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     # Always check dilemma files
-    errors = check_dilemma_files()
+    errors, all_dilemmas_data = check_dilemma_files(collect=bool(args.results))
     if errors:
         print(f"❌ {errors} error(s) found in dilemma files.")
         # We still proceed to parse results if provided, as they might be independent
@@ -185,7 +307,6 @@ if __name__ == "__main__":
 
     # Parse results if the argument is provided
     if args.results:
-        all_dilemmas_data = load_all_dilemmas(DILEMMA_DIR)
         results_path: pathlib.Path = args.results
 
         result_files_to_process = []
@@ -261,43 +382,62 @@ if __name__ == "__main__":
                     )
                     can_write_to_csv = False
 
-            master_csv_rows = []
-            for res_file_path in result_files_to_process:
-                print(f"Parsing results from: {res_file_path.name}")
-                parsed_rows = parse_runner_output(res_file_path, all_dilemmas_data)
-                master_csv_rows.extend(parsed_rows)
-
-            if can_write_to_csv:
-                if master_csv_rows:
+            # Each results file's rows are appended as soon as it is parsed
+            # (formatted in memory, one write per file), so memory holds one
+            # file's rows rather than all of them.
+            parsed_count = 0
+            written_count = 0
+            write_error = None
+            with contextlib.ExitStack() as stack:
+                fh_csv = None
+                for res_file_path in result_files_to_process:
+                    print(f"Parsing results from: {res_file_path.name}")
+                    parsed_rows = parse_runner_output(res_file_path, all_dilemmas_data)
+                    parsed_count += len(parsed_rows)
+                    if not can_write_to_csv or not parsed_rows or write_error:
+                        continue
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    if write_new_header_row and not written_count:
+                        writer.writerow(csv_header)
+                    writer.writerows(parsed_rows)
                     try:
-                        with output_csv_path.open(
-                            mode="a", newline="", encoding="utf-8"
-                        ) as fh_csv:
-                            writer = csv.writer(fh_csv)
-                            if write_new_header_row:
-                                writer.writerow(csv_header)
-                            writer.writerows(master_csv_rows)
-                        print(
-                            f"📊 Successfully appended {len(master_csv_rows)} new records to {output_csv_path}"
-                        )
-                        if write_new_header_row:
-                            print(
-                                "(New CSV file created or header written to empty file.)"
+                        if fh_csv is None:
+                            fh_csv = stack.enter_context(
+                                output_csv_path.open("ab", buffering=CSV_BUFFER_SIZE)
                             )
+                        fh_csv.write(buf.getvalue().encode("utf-8"))
                     except IOError as e:
-                        print(f"❌ Error writing to CSV file '{output_csv_path}': {e}")
+                        write_error = e
+                        continue
+                    written_count += len(parsed_rows)
+                if fh_csv is not None and write_error is None:
+                    try:
+                        fh_csv.flush()  # Surface buffered write errors here
+                    except IOError as e:
+                        write_error = e
+
+            if can_write_to_csv:
+                if write_error is not None:
+                    print(
+                        f"❌ Error writing to CSV file '{output_csv_path}': {write_error}"
+                    )
+                elif written_count:
+                    print(
+                        f"📊 Successfully appended {written_count} new records to {output_csv_path}"
+                    )
+                    if write_new_header_row:
+                        print("(New CSV file created or header written to empty file.)")
                 else:
                     print("No new valid records found to add to the CSV.")
-            elif master_csv_rows:  # Can't write, but had rows
+            elif parsed_count:  # Can't write, but had rows
                 print(
-                    f"Parsed {len(master_csv_rows)} records, but CSV writing was skipped due to header incompatibility."
+                    f"Parsed {parsed_count} records, but CSV writing was skipped due to header incompatibility."
+                )
+            else:  # Can't write and no rows
+                print(
+                    "CSV writing skipped due to header incompatibility and no new records were parsed."
                 )
-            else:  # Can't write and no rows, or can write but no rows
-                if not can_write_to_csv:
-                    print(
-                        "CSV writing skipped due to header incompatibility and no new records were parsed."
-                    )
-                # else: (can_write_to_csv is true, but no master_csv_rows - covered by "No new valid records...")
 
     if errors:  # Exit with error if dilemma files had issues
         sys.exit(1)
@@ -4,15 +4,60 @@ Script to fetch all Talmud texts (Bavli and Yerushalmi) from Sefaria API.
 For Mishna tractates that don't have Talmud, fetches the Mishna text instead.
 """
 
+import argparse
+import asyncio
+import hashlib
 import json
+import os
 import re
 import requests
-import time
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+from urllib3.util.retry import Retry
+
+try:
+    from orjson import dumps as _dumps, loads as _loads
+except ModuleNotFoundError:
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
 
 # Base URL for Sefaria API
 SEFARIA_API_BASE = "https://www.sefaria.org/api/v3/texts/"
+# Requests in flight at once
+MAX_CONCURRENT_REQUESTS = 5
+# Response headers kept in a ``.meta`` sidecar for conditional requests
+VALIDATOR_HEADERS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+# Returned by fetch_text_from_sefaria when the cached copy is still current
+NOT_MODIFIED: Dict[str, Any] = {}
+
+# Fields that hold the text itself in Sefaria responses, in output order
+TEXT_FIELDS = ("text", "he", "en", "content", "body")
+# Part of the extracted-text cache key; bump when extraction output changes
+EXTRACTOR_VERSION = 1
+
+# One pooled keep-alive session for all requests
+SESSION = requests.Session()
+SESSION.headers.update({"accept": "application/json"})
+_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_CONCURRENT_REQUESTS,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+    ),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+_FN_SPACE_RE = re.compile(r"[/\s]+")
+_FN_BAD_RE = re.compile(r'[<>:"|?*]')
 
 # All Mishna tractates organized by Seder
 MISHNA_TRACTATES = {
@@ -181,129 +226,347 @@ YERUSHALMI_TRACTATES = [
 def sanitize_filename(name: str) -> str:
     """Sanitize a string to be used as a filename."""
     # Replace spaces and slashes with underscores
-    sanitized = re.sub(r"[/\s]+", "_", name)
+    sanitized = _FN_SPACE_RE.sub("_", name)
     # Remove other problematic characters
-    sanitized = re.sub(r'[<>:"|?*]', "", sanitized)
+    sanitized = _FN_BAD_RE.sub("", sanitized)
     return sanitized
 
 
-def fetch_text_from_sefaria(
-    text_name: str, max_retries: int = 3
-) -> Optional[Dict[str, Any]]:
+# Lookups built once: tractate -> file name stem, and set membership
+FILENAME = {
+    tractate: sanitize_filename(tractate)
+    for seder_tractates in MISHNA_TRACTATES.values()
+    for tractate in seder_tractates
+}
+BAVLI = frozenset(BAVLI_TRACTATES)
+YERUSHALMI = frozenset(YERUSHALMI_TRACTATES)
+
+
+async def fetch_text_from_sefaria(
+    text_name: str,
+    sem: asyncio.Semaphore,
+    validators: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
     """
-    Fetch text from Sefaria API with retry logic.
+    Fetch text from Sefaria API.
+
+    Retries with backoff (honoring Retry-After) are done by ``SESSION``.
 
     Args:
         text_name: Name of the text to fetch
-        max_retries: Maximum number of retry attempts
+        sem: Limits how many requests are in flight at once
+        validators: ETag/Last-Modified of a cached copy, sent as conditions
 
     Returns:
-        JSON response as dictionary, or None if failed
+        JSON response as dictionary (NOT_MODIFIED on 304, None if failed)
+        and the validators of the response
     """
     url = f"{SEFARIA_API_BASE}{text_name}"
-    headers = {"accept": "application/json"}
-
-    for attempt in range(max_retries):
-        try:
-            print(f"  Fetching {text_name} (attempt {attempt + 1}/{max_retries})...")
-            response = requests.get(url, headers=headers, timeout=30)
-
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 404:
-                print(f"  Text '{text_name}' not found (404)")
-                return None
-            else:
-                print(f"  HTTP {response.status_code} for {text_name}")
-                if attempt < max_retries - 1:
-                    time.sleep(2**attempt)  # Exponential backoff
+    headers = {
+        VALIDATOR_HEADERS[name]: value for name, value in (validators or {}).items()
+    }
 
-        except requests.exceptions.RequestException as e:
-            print(f"  Request failed for {text_name}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2**attempt)
-
-    print(f"  Failed to fetch {text_name} after {max_retries} attempts")
-    return None
+    try:
+        print(f"  Fetching {text_name}...")
+        async with sem:  # Blocking requests call runs in a worker thread
+            response = await asyncio.to_thread(
+                SESSION.get, url, headers=headers, timeout=30
+            )
+
+        if response.status_code == 200:
+            return _loads(response.content), {
+                name: response.headers[name]
+                for name in VALIDATOR_HEADERS
+                if name in response.headers
+            }
+        elif response.status_code == 304:
+            return NOT_MODIFIED, validators or {}
+        elif response.status_code == 404:
+            print(f"  Text '{text_name}' not found (404)")
+        else:
+            print(f"  HTTP {response.status_code} for {text_name}")
+
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # ValueError: a 200 whose body is not valid JSON
+        print(f"  Request failed for {text_name}: {e}")
+
+    return None, {}
+
+
+def load_json_file(filepath: Path) -> Optional[Dict[str, Any]]:
+    """Load a previously saved JSON file, or None if missing or unreadable."""
+    try:
+        return _loads(filepath.read_bytes())
+    except (OSError, ValueError):
+        return None
 
 
 def save_json_response(data: Dict[str, Any], filepath: Path) -> bool:
     """Save JSON response to file."""
     try:
         filepath.parent.mkdir(parents=True, exist_ok=True)
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # Compact: the raw responses are only read back by scripts
+        filepath.write_bytes(_dumps(data))
         return True
     except Exception as e:
         print(f"  Error saving JSON to {filepath}: {e}")
         return False
 
 
-def extract_text_content(data: Dict[str, Any]) -> str:
+def extract_text_content(data: Dict[str, Any]) -> List[str]:
     """
     Extract readable text content from Sefaria JSON response.
     Handles various text structures and removes HTML tags.
+    Returns the cleaned fragments, to be separated by blank lines.
     """
 
     def clean_html(text: str) -> str:
         """Remove HTML tags from text."""
         if not isinstance(text, str):
             return str(text)
-        # Remove HTML tags
-        clean = re.sub(r"<[^>]+>", "", text)
+        # Remove HTML tags: scan for "<...>" pairs, keeping an empty "<>"
+        # and anything after an unclosed "<"
+        out = []
+        i = 0
+        find = text.find
+        while True:
+            lt = find("<", i)
+            if lt < 0:
+                break
+            gt = find(">", lt + 1)
+            if gt < 0:
+                break
+            if gt == lt + 1:  # "<>" is not a tag
+                out.append(text[i:gt])
+                i = gt
+            else:
+                out.append(text[i:lt])
+                i = gt + 1
+        out.append(text[i:])
         # Clean up extra whitespace
-        clean = re.sub(r"\s+", " ", clean).strip()
-        return clean
+        return " ".join("".join(out).split())
 
-    def extract_from_structure(obj: Any, level: int = 0) -> List[str]:
-        """Recursively extract text from nested structures."""
-        texts = []
+    def extract_from_structure(obj: Any) -> List[str]:
+        """Extract text from nested structures, depth first.
 
-        if isinstance(obj, str):
-            cleaned = clean_html(obj)
-            if cleaned:
-                texts.append(cleaned)
-        elif isinstance(obj, list):
-            for item in obj:
-                texts.extend(extract_from_structure(item, level + 1))
-        elif isinstance(obj, dict):
-            # Look for common text fields
-            text_fields = ["text", "he", "en", "content", "body"]
-            for field in text_fields:
-                if field in obj:
-                    texts.extend(extract_from_structure(obj[field], level + 1))
-
-            # If no text fields found, recurse through all values
-            if not texts and level < 3:  # Limit recursion depth
-                for value in obj.values():
-                    texts.extend(extract_from_structure(value, level + 1))
+        Uses an explicit stack rather than recursion. A dict contributes its
+        common text fields; if those yield no text (and it is less than
+        three levels deep), all of its values are searched instead.
+        """
+        texts = []
+        # (node, level); a dict's pending fallback is queued as
+        # (dict, level, len(texts)) below its text fields
+        stack = [(obj, 0)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            entry = pop()
+            obj, level = entry[0], entry[1]
+            if len(entry) == 3:
+                # Text fields done: fall back to all values if they gave none
+                if len(texts) == entry[2] and level < 3:  # Limit depth
+                    stack.extend((value, level + 1) for value in reversed(obj.values()))
+            elif isinstance(obj, str):
+                cleaned = clean_html(obj)
+                if cleaned:
+                    texts.append(cleaned)
+            elif isinstance(obj, list):
+                stack.extend((item, level + 1) for item in reversed(obj))
+            elif isinstance(obj, dict):
+                push((obj, level, len(texts)))
+                # Look for common text fields
+                for field in reversed(TEXT_FIELDS):
+                    if field in obj:
+                        push((obj[field], level + 1))
 
         return texts
 
     # Extract all text content
-    all_texts = extract_from_structure(data)
+    return extract_from_structure(data) or ["No text content found"]
 
-    # Join with appropriate separators
-    if all_texts:
-        return "\n\n".join(all_texts)
-    else:
-        return "No text content found"
 
+def save_text_content(fragments: Iterable[str], filepath: Path) -> bool:
+    """Save text fragments to file, separated by blank lines.
 
-def save_text_content(content: str, filepath: Path) -> bool:
-    """Save text content to file."""
+    Fragments are written one at a time instead of being joined first.
+    """
     try:
         filepath.parent.mkdir(parents=True, exist_ok=True)
         with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+            write = f.write
+            for i, fragment in enumerate(fragments):
+                if i:
+                    write("\n\n")
+                write(fragment)
         return True
     except Exception as e:
         print(f"  Error saving text to {filepath}: {e}")
         return False
 
 
+def extract_and_save_text(
+    json_path: Path,
+    text_path: Path,
+    cache_dir: Path,
+    data: Optional[Dict[str, Any]] = None,
+    force: bool = False,
+) -> bool:
+    """Extract text from a saved response and save it; runs in a worker process.
+
+    Extracted text is kept in ``cache_dir`` under the text's name and a
+    BLAKE2b digest of ``EXTRACTOR_VERSION`` and the response JSON, so an
+    unchanged response is copied instead of extracted again; ``force``
+    extracts regardless and refreshes the cached copy. Each text keeps one
+    cached copy: stale ones are removed when a new one is stored. ``data``
+    is only passed when it could not be saved to ``json_path``.
+    """
+    if data is not None:
+        return save_text_content(extract_text_content(data), text_path)
+
+    try:
+        raw = json_path.read_bytes()
+    except OSError as e:
+        print(f"  Error reading JSON from {json_path}: {e}")
+        return False
+    digest = hashlib.blake2b(b"%d\n" % EXTRACTOR_VERSION, digest_size=16)
+    digest.update(raw)
+    cached = cache_dir / f"{text_path.stem}-{digest.hexdigest()}.txt"
+    if not force:
+        try:
+            shutil.copyfile(cached, text_path)
+            return True
+        except OSError:
+            pass  # Not cached yet
+
+    if not save_text_content(extract_text_content(_loads(raw)), text_path):
+        return False
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(text_path, cached)
+        for old in cache_dir.glob(f"{text_path.stem}-*.txt"):
+            if old != cached:
+                old.unlink(missing_ok=True)
+    except OSError:
+        pass  # Read-only cache: the next run just extracts again
+    return True
+
+
+async def process_tractate(
+    tractate: str,
+    position: str,
+    sem: asyncio.Semaphore,
+    pool: ProcessPoolExecutor,
+    sources_dir: Path,
+    texts_dir: Path,
+    cache_dir: Path,
+    force: bool = False,
+) -> int:
+    """Fetch and save every available text of one tractate.
+
+    A text whose JSON is already in ``sources_dir`` is only revalidated
+    (or, without a ``.meta`` sidecar, reused as is) unless ``force`` is set.
+
+    Text extraction runs in ``pool`` so it overlaps with downloads, and is
+    skipped for responses already extracted into ``cache_dir``.
+
+    Returns the number of texts saved or already up to date.
+    """
+    loop = asyncio.get_running_loop()
+    print(f"\n{position} Processing {tractate}...")
+
+    # (label, Sefaria text name, file suffix): Bavli and Yerushalmi where
+    # they exist, and always the Mishna
+    variants = []
+    if tractate in BAVLI:
+        variants.append(("Bavli", tractate, "bavli"))  # Simple names for Bavli
+    if tractate in YERUSHALMI:
+        variants.append(("Yerushalmi", f"Jerusalem Talmud {tractate}", "yerushalmi"))
+    variants.append(("Mishna", f"Mishnah {tractate}", "mishna"))
+
+    stem = FILENAME[tractate]
+    successful_fetches = 0
+    for label, text_name, suffix in variants:
+        json_filename = f"{stem}_{suffix}.json"
+        json_path = sources_dir / json_filename
+        meta_path = json_path.with_suffix(".meta")
+        text_filename = f"{stem}_{suffix}.txt"
+        text_path = texts_dir / text_filename
+
+        cached = None if force else load_json_file(json_path)
+        validators = load_json_file(meta_path) if cached is not None else None
+        if cached is not None and not validators:
+            data = NOT_MODIFIED  # No validators to revalidate with
+        else:
+            data, validators = await fetch_text_from_sefaria(text_name, sem, validators)
+
+        if data is NOT_MODIFIED:
+            print(f"  ✓ {label} up to date: {json_filename}")
+            if text_path.exists():
+                successful_fetches += 1
+                continue
+            data = None  # Extracted from the JSON already saved
+        elif not data:
+            continue
+        else:
+            # Save JSON
+            if save_json_response(data, json_path):
+                data = None  # Workers read it back from json_path
+                print(f"  ✓ Saved {label} JSON: {json_filename}")
+                if validators:
+                    save_json_response(validators, meta_path)
+                else:
+                    meta_path.unlink(missing_ok=True)
+
+        # Extract and save text
+        if await loop.run_in_executor(
+            pool, extract_and_save_text, json_path, text_path, cache_dir, data, force
+        ):
+            print(f"  ✓ Saved {label} text: {text_filename}")
+            successful_fetches += 1
+
+    return successful_fetches
+
+
+async def fetch_all(
+    tractates: List[str],
+    sources_dir: Path,
+    texts_dir: Path,
+    cache_dir: Path,
+    force: bool = False,
+) -> int:
+    """Process all tractates concurrently; returns the number of texts saved."""
+    # Be respectful to the API: at most this many requests at a time
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    total = len(tractates)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        counts = await asyncio.gather(
+            *(
+                process_tractate(
+                    tractate,
+                    f"[{i}/{total}]",
+                    sem,
+                    pool,
+                    sources_dir,
+                    texts_dir,
+                    cache_dir,
+                    force,
+                )
+                for i, tractate in enumerate(tractates, 1)
+            )
+        )
+    return sum(counts)
+
+
 def main():
     """Main function to fetch all Talmud texts."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="re-download texts even if their JSON is already saved",
+    )
+    args = parser.parse_args()
+
     print("Starting Sefaria text fetching process...")
     print("Using verified Sefaria naming conventions:")
     print("  - Bavli: Simple tractate names (e.g., 'Berakhot')")
@@ -315,83 +578,16 @@ def main():
     texts_dir = Path("data/texts")
     sources_dir.mkdir(parents=True, exist_ok=True)
     texts_dir.mkdir(parents=True, exist_ok=True)
+    # Extracted text by response digest, next to the other local caches
+    cache_dir = Path("data/.cache/sefaria_texts")
 
-    # Get all unique tractate names
-    all_tractates = set()
-    for seder_tractates in MISHNA_TRACTATES.values():
-        all_tractates.update(seder_tractates)
-
-    total_tractates = len(all_tractates)
-    processed = 0
-    successful_fetches = 0
-
+    # All unique tractate names
+    total_tractates = len(FILENAME)
     print(f"\nProcessing {total_tractates} tractates...")
 
-    for tractate in sorted(all_tractates):
-        processed += 1
-        print(f"\n[{processed}/{total_tractates}] Processing {tractate}...")
-
-        # Try to fetch Bavli Talmud first
-        if tractate in BAVLI_TRACTATES:
-            bavli_name = tractate  # Sefaria uses simple names for Bavli
-            bavli_data = fetch_text_from_sefaria(bavli_name)
-
-            if bavli_data:
-                # Save JSON
-                json_filename = f"{sanitize_filename(tractate)}_bavli.json"
-                json_path = sources_dir / json_filename
-                if save_json_response(bavli_data, json_path):
-                    print(f"  ✓ Saved Bavli JSON: {json_filename}")
-
-                # Extract and save text
-                text_content = extract_text_content(bavli_data)
-                text_filename = f"{sanitize_filename(tractate)}_bavli.txt"
-                text_path = texts_dir / text_filename
-                if save_text_content(text_content, text_path):
-                    print(f"  ✓ Saved Bavli text: {text_filename}")
-                    successful_fetches += 1
-
-        # Try to fetch Yerushalmi Talmud
-        if tractate in YERUSHALMI_TRACTATES:
-            yerushalmi_name = f"Jerusalem Talmud {tractate}"
-            yerushalmi_data = fetch_text_from_sefaria(yerushalmi_name)
-
-            if yerushalmi_data:
-                # Save JSON
-                json_filename = f"{sanitize_filename(tractate)}_yerushalmi.json"
-                json_path = sources_dir / json_filename
-                if save_json_response(yerushalmi_data, json_path):
-                    print(f"  ✓ Saved Yerushalmi JSON: {json_filename}")
-
-                # Extract and save text
-                text_content = extract_text_content(yerushalmi_data)
-                text_filename = f"{sanitize_filename(tractate)}_yerushalmi.txt"
-                text_path = texts_dir / text_filename
-                if save_text_content(text_content, text_path):
-                    print(f"  ✓ Saved Yerushalmi text: {text_filename}")
-                    successful_fetches += 1
-
-        # Always try to fetch Mishna text as well
-        mishna_name = f"Mishnah {tractate}"
-        mishna_data = fetch_text_from_sefaria(mishna_name)
-
-        if mishna_data:
-            # Save JSON
-            json_filename = f"{sanitize_filename(tractate)}_mishna.json"
-            json_path = sources_dir / json_filename
-            if save_json_response(mishna_data, json_path):
-                print(f"  ✓ Saved Mishna JSON: {json_filename}")
-
-            # Extract and save text
-            text_content = extract_text_content(mishna_data)
-            text_filename = f"{sanitize_filename(tractate)}_mishna.txt"
-            text_path = texts_dir / text_filename
-            if save_text_content(text_content, text_path):
-                print(f"  ✓ Saved Mishna text: {text_filename}")
-                successful_fetches += 1
-
-        # Be respectful to the API - add a small delay
-        time.sleep(1)
+    successful_fetches = asyncio.run(
+        fetch_all(sorted(FILENAME), sources_dir, texts_dir, cache_dir, args.force)
+    )
 
     print(f"\n✅ Completed processing all {total_tractates} tractates!")
     print(f"📊 Successfully fetched {successful_fetches} texts")
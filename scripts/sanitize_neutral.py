@@ -1,16 +1,30 @@
+import hashlib
 import json
+import os
 import pathlib
 import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+try:
+    from orjson import dumps as _dumps, loads as _loads
+except ModuleNotFoundError:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 NEUTRAL_DIR = ROOT / "data" / "dilemmas-neutral"
+# Content hash of each file as last written, so unchanged files are skipped
+SANITIZE_CACHE = ROOT / "data" / ".cache" / "sanitize_neutral.json"
 
+# Keys are matched case-insensitively, so each word is listed once
 REPLACEMENTS = {
     r"\bShabbat\b": "rest day",
-    r"\bshabbat\b": "rest day",
     r"\bShabbos\b": "rest day",
     r"\bGentile\b": "outsider",
-    r"\bgentile\b": "outsider",
     r"\bJewish\b": "observant",
     r"\bsynagogue\b": "community center",
     r"\bRivka\b": "Robin",
@@ -67,36 +81,121 @@ REPLACEMENTS = {
     r"\bhalakhic\b": "formal",
 }
 
-pattern = re.compile("|".join(REPLACEMENTS.keys()), flags=re.IGNORECASE)
+# One named group per key, so a match names its replacement via lastgroup
+pattern = re.compile(
+    "|".join(f"(?P<g{i}>{key})" for i, key in enumerate(REPLACEMENTS)),
+    flags=re.IGNORECASE,
+)
+REPLS = {f"g{i}": val for i, val in enumerate(REPLACEMENTS.values())}
+
+
+def _repl(match: re.Match) -> str:
+    return REPLS[match.lastgroup]
+
+
+def _required_literal(key: str) -> str:
+    """Longest plain run of ``key`` that every match contains, lowercased."""
+    return max(re.split(r"\\b|\[[^\]]*\]\??", key), key=len).lower()
+
+
+_literals = {_required_literal(key) for key in REPLACEMENTS}
+# Every match contains one of these ("priest" covers "priests", ...)
+LITERALS = tuple(
+    sorted(
+        lit for lit in _literals if not any(o != lit and o in lit for o in _literals)
+    )
+)
 
 
 def sanitize_text(text: str) -> str:
-    def repl(match: re.Match) -> str:
-        original = match.group(0)
-        for key, val in REPLACEMENTS.items():
-            if re.fullmatch(key, original, flags=re.IGNORECASE):
-                return val
-        return original
+    # Fast path: ASCII text containing no trigger literal cannot match.
+    # Non-ASCII text always takes the regex, as IGNORECASE folds e.g. "ı"
+    # onto "i" where str.lower() does not.
+    if text.isascii():
+        lowered = text.lower()
+        if not any(lit in lowered for lit in LITERALS):
+            return text
+    return pattern.sub(_repl, text)
+
+
+def _file_digest(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sanitize_file(path: pathlib.Path, known_hash: Optional[str] = None) -> str:
+    """Sanitize ``path`` in place unless its content hash is ``known_hash``.
+
+    Lines are streamed into a temporary file that then replaces ``path``, so
+    memory stays flat and an interrupted run leaves the original intact.
+
+    Returns the content hash of the sanitized file.
+    """
+    if known_hash is not None and _file_digest(path) == known_hash:
+        return known_hash
+    digest = hashlib.sha256()
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    try:
+        with path.open("rb") as fin, tmp.open("wb") as fout:
+            for line in fin:
+                item = _loads(line)
+                item["title"] = sanitize_text(item["title"])
+                item["vignette"] = sanitize_text(item["vignette"])
+                for opt in item.get("options", ()):
+                    opt["text"] = sanitize_text(opt["text"])
+                data = _dumps(item) + b"\n"
+                digest.update(data)
+                fout.write(data)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, path)
+    return digest.hexdigest()
+
+
+def _rules_key() -> str:
+    return hashlib.sha256(json.dumps(REPLACEMENTS).encode("utf-8")).hexdigest()
+
 
-    return pattern.sub(repl, text)
+def _read_sanitize_cache() -> dict:
+    """Hashes from the last run, or {} if REPLACEMENTS changed since."""
+    try:
+        cache = json.loads(SANITIZE_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if cache.get("rules") != _rules_key():
+        return {}
+    return cache.get("files", {})
 
 
-def sanitize_file(path: pathlib.Path) -> None:
-    lines = path.read_text(encoding="utf-8").splitlines()
-    new_lines = []
-    for line in lines:
-        item = json.loads(line)
-        item["title"] = sanitize_text(item["title"])
-        item["vignette"] = sanitize_text(item["vignette"])
-        for opt in item.get("options", []):
-            opt["text"] = sanitize_text(opt["text"])
-        new_lines.append(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
-    path.write_text("\n".join(new_lines) + "\n", encoding="utf-8")
+def _write_sanitize_cache(hashes: dict) -> None:
+    try:
+        SANITIZE_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        SANITIZE_CACHE.write_text(
+            json.dumps({"rules": _rules_key(), "files": hashes}), encoding="utf-8"
+        )
+    except OSError:
+        pass  # Read-only checkout: the next run just sanitizes everything again
 
 
 def main() -> None:
-    for jf in NEUTRAL_DIR.rglob("*.jsonl"):
-        sanitize_file(jf)
+    files = list(NEUTRAL_DIR.rglob("*.jsonl"))
+    names = [str(jf.relative_to(ROOT)) for jf in files]
+    cache = _read_sanitize_cache()
+    # Files are independent and the work is CPU-bound regex substitution
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        hashes = pool.map(
+            sanitize_file,
+            files,
+            [cache.get(name) for name in names],
+            chunksize=max(1, len(files) // (workers * 4)),
+        )
+        # Consumed here, so a worker's exception is raised before the write
+        _write_sanitize_cache(dict(zip(names, hashes)))
 
 
 if __name__ == "__main__":